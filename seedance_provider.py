@@ -1,46 +1,44 @@
 import os
 import time
+import logging
+import asyncio
+import threading
+import httpx
 from dotenv import load_dotenv
 from byteplussdkarkruntime import Ark
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Initialize the Ark client
 _client = Ark(
     base_url=os.getenv("ARK_BASE_URL"),
     api_key=os.getenv("ARK_API_KEY"),
 )
 
+# REST endpoint used by the async variants
+_TASKS_URL = f"{(os.getenv('ARK_BASE_URL') or '').rstrip('/')}/contents/generations/tasks"
+_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {os.getenv('ARK_API_KEY')}",
+}
+
 DEFAULT_MODEL = "seedance-1-5-pro-251215"
 VIDEO_EXTEND_MODEL = "seedance-1-5-pro-video-extend"
 
+# Task statuses after which a task never changes again
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled", "expired")
 
-def generate_video(
+
+def _build_video_content(
     prompt: str,
     reference_image_url: str = None,
     duration: int = 5,
     camera_fixed: bool = False,
-    model: str = DEFAULT_MODEL,
-    poll_interval: float = 1.0,
-) -> dict:
-    """
-    Generate a video using Seedance API.
-    
-    Args:
-        prompt: Text description for the video
-        reference_image_url: Optional URL of reference image for image-to-video generation
-        duration: Video duration in seconds (default: 5)
-        camera_fixed: Whether to fix camera position (default: False)
-        model: Model ID to use (default: seedance-1-5-pro-251215)
-        poll_interval: Seconds between status polling (default: 1.0)
-    
-    Returns:
-        dict: Task result containing video information
-    
-    Raises:
-        Exception: If video generation fails
-    """
+) -> list:
+    """Build the content list for a video generation task."""
     # Build the full prompt with parameters
     full_prompt = f"{prompt}  --duration {duration} --camerafixed {str(camera_fixed).lower()}"
     
@@ -61,31 +59,141 @@ def generate_video(
             }
         })
     
-    # Create the generation task
-    print("----- Creating video generation task -----")
+    return content
+
+
+def _build_extend_content(video_url: str, prompt: str, duration: int = 5) -> list:
+    """Build the content list for a video extension task."""
+    # Build the full prompt with parameters
+    full_prompt = f"{prompt}  --duration {duration}"
+    
+    return [
+        {
+            "type": "text",
+            "text": full_prompt
+        },
+        {
+            "type": "video_url",
+            "video_url": {
+                "url": video_url
+            }
+        }
+    ]
+
+
+def _callback_options(callback_url: str = None) -> dict:
+    """
+    Extra task-creation fields for push notifications.
+    
+    Ark has no long-poll option on the task query endpoint; instead it can
+    POST the task to callback_url on every status change. Status polling
+    stays in place so results are returned either way.
+    """
+    return {"callback_url": callback_url} if callback_url else {}
+
+
+def _submit_task(
+    model: str,
+    content: list,
+    callback_url: str = None,
+    action: str = "generation",
+) -> str:
+    """Create a content generation task and return its ID without waiting."""
+    logger.debug("Creating video %s task", action)
     create_result = _client.content_generation.tasks.create(
         model=model,
-        content=content
+        content=content,
+        **_callback_options(callback_url),
     )
-    print(f"Task created with ID: {create_result.id}")
+    logger.info("Task created with ID: %s", create_result.id)
+    return create_result.id
+
+
+def _poll_task(
+    task_id: str,
+    initial: float = 0.5,
+    base: float = 1.3,
+    cap: float = 30.0,
+    action: str = "generation",
+) -> dict:
+    """
+    Poll a task until it finishes, using truncated exponential backoff.
     
-    # Poll for completion
-    print("----- Polling task status -----")
-    task_id = create_result.id
+    Args:
+        task_id: ID of the task to poll
+        initial: Seconds to wait after the first poll (default: 0.5)
+        base: Multiplier applied to the interval after each poll (default: 1.3)
+        cap: Maximum seconds between polls (default: 30.0)
+        action: Task kind used in the failure message (default: "generation")
+    
+    Returns:
+        dict: Task result once the task has succeeded
+    
+    Raises:
+        Exception: If the task ends in any status other than succeeded
+    """
+    interval = initial
     
     while True:
         get_result = _client.content_generation.tasks.get(task_id=task_id)
         status = get_result.status
         
         if status == "succeeded":
-            print("----- Task succeeded -----")
+            logger.info("Task %s succeeded", task_id)
             return get_result
-        elif status == "failed":
-            print("----- Task failed -----")
-            raise Exception(f"Video generation failed: {get_result.error}")
+        elif status in TERMINAL_STATUSES:
+            logger.info("Task %s %s", task_id, status)
+            raise Exception(f"Video {action} {status}: {get_result.error}")
         else:
-            print(f"Current status: {status}, retrying in {poll_interval}s...")
-            time.sleep(poll_interval)
+            logger.debug("Current status: %s, retrying in %.1fs...", status, interval)
+            time.sleep(interval)
+            interval = min(interval * base, cap)
+
+
+def generate_video(
+    prompt: str,
+    reference_image_url: str = None,
+    duration: int = 5,
+    camera_fixed: bool = False,
+    model: str = DEFAULT_MODEL,
+    poll_interval: float = 0.5,
+    backoff_base: float = 1.3,
+    backoff_cap: float = 30.0,
+    callback_url: str = None,
+) -> dict:
+    """
+    Generate a video using Seedance API.
+    
+    Args:
+        prompt: Text description for the video
+        reference_image_url: Optional URL of reference image for image-to-video generation
+        duration: Video duration in seconds (default: 5)
+        camera_fixed: Whether to fix camera position (default: False)
+        model: Model ID to use (default: seedance-1-5-pro-251215)
+        poll_interval: Initial seconds between status polling (default: 0.5)
+        backoff_base: Multiplier applied to the interval after each poll (default: 1.3)
+        backoff_cap: Maximum seconds between status polling (default: 30.0)
+        callback_url: Optional URL that Ark notifies whenever the task status changes
+    
+    Returns:
+        dict: Task result containing video information
+    
+    Raises:
+        Exception: If video generation fails
+    """
+    content = _build_video_content(prompt, reference_image_url, duration, camera_fixed)
+    
+    task_id = _submit_task(model, content, callback_url, action="generation")
+    
+    # Poll for completion
+    logger.debug("Polling task %s status", task_id)
+    return _poll_task(
+        task_id,
+        initial=poll_interval,
+        base=backoff_base,
+        cap=backoff_cap,
+        action="generation",
+    )
 
 
 def extend_video(
@@ -96,7 +204,10 @@ def extend_video(
     aspect_ratio: str = "16:9",
     generate_audio: bool = True,
     model: str = VIDEO_EXTEND_MODEL,
-    poll_interval: float = 1.0,
+    poll_interval: float = 0.5,
+    backoff_base: float = 1.3,
+    backoff_cap: float = 30.0,
+    callback_url: str = None,
 ) -> dict:
     """
     Extend a video using Seedance API.
@@ -109,7 +220,10 @@ def extend_video(
         aspect_ratio: Output aspect ratio (default: "16:9")
         generate_audio: Whether to generate/extend audio (default: True)
         model: Model ID to use (default: seedance-1-5-pro-video-extend)
-        poll_interval: Seconds between status polling (default: 1.0)
+        poll_interval: Initial seconds between status polling (default: 0.5)
+        backoff_base: Multiplier applied to the interval after each poll (default: 1.3)
+        backoff_cap: Maximum seconds between status polling (default: 30.0)
+        callback_url: Optional URL that Ark notifies whenever the task status changes
     
     Returns:
         dict: Task result containing extended video information
@@ -117,46 +231,304 @@ def extend_video(
     Raises:
         Exception: If video extension fails
     """
-    # Build the full prompt with parameters
-    full_prompt = f"{prompt}  --duration {duration}"
+    content = _build_extend_content(video_url, prompt, duration)
     
-    # Build content list
-    content = [
-        {
-            "type": "text",
-            "text": full_prompt
-        },
-        {
-            "type": "video_url",
-            "video_url": {
-                "url": video_url
-            }
-        }
-    ]
+    task_id = _submit_task(model, content, callback_url, action="extension")
     
-    # Create the extension task
-    print("----- Creating video extension task -----")
-    create_result = _client.content_generation.tasks.create(
-        model=model,
-        content=content
+    # Poll for completion
+    logger.debug("Polling task %s status", task_id)
+    return _poll_task(
+        task_id,
+        initial=poll_interval,
+        base=backoff_base,
+        cap=backoff_cap,
+        action="extension",
     )
-    print(f"Task created with ID: {create_result.id}")
+
+
+async def _create_task_async(
+    client: httpx.AsyncClient,
+    model: str,
+    content: list,
+    callback_url: str = None,
+) -> str:
+    """Create a content generation task via the REST API and return its ID."""
+    body = {"model": model, "content": content, **_callback_options(callback_url)}
+    response = await client.post(_TASKS_URL, json=body)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+class _Waiter:
+    """One awaiter of a task: its event loop, event and final result."""
     
-    # Poll for completion
-    print("----- Polling task status -----")
-    task_id = create_result.id
+    __slots__ = ("loop", "event", "result")
     
-    while True:
-        get_result = _client.content_generation.tasks.get(task_id=task_id)
-        status = get_result.status
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+        self.result = None  # Task result JSON or Exception, set before event
+
+
+class _TaskWatcher:
+    """
+    Watch many tasks with a single background poller.
+    
+    Awaiters register a task ID and wait on their own asyncio.Event; several
+    awaiters of the same task are all woken. One daemon thread queries the
+    task-list endpoint for all registered IDs at a fixed cadence and sets
+    each event once its task reaches a terminal status, so N concurrent
+    tasks cost one request per interval instead of N. A task
+    whose query keeps failing, or that keeps missing from the response, is
+    failed with the last error instead of being waited on forever.
+    """
+    
+    PAGE_SIZE = 500  # Maximum page size of the task-list endpoint
+    MAX_FAILURES = 5  # Consecutive failed or missing polls before giving up on a task
+    
+    def __init__(self, poll_interval: float = 2.0):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._waiters = {}  # {task_id: [_Waiter, ...]}
+        self._failures = {}  # {task_id: consecutive failed or missing polls}
+        self._thread = None
+    
+    def register(self, task_id: str) -> _Waiter:
+        """Start watching a task; the waiter's event is set when it finishes."""
+        waiter = _Waiter()
+        with self._lock:
+            self._waiters.setdefault(task_id, []).append(waiter)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return waiter
+    
+    def discard(self, task_id: str, waiter: _Waiter):
+        """Stop watching a task for an awaiter that has gone away."""
+        with self._lock:
+            waiters = self._waiters.get(task_id)
+            if waiters is None or waiter not in waiters:
+                return
+            waiters.remove(waiter)
+            if not waiters:
+                del self._waiters[task_id]
+                self._failures.pop(task_id, None)
+    
+    def _run(self):
+        with httpx.Client(headers=_HEADERS, timeout=30.0) as client:
+            while True:
+                with self._lock:
+                    task_ids = list(self._waiters)
+                    if not task_ids:
+                        self._thread = None
+                        return
+                
+                for i in range(0, len(task_ids), self.PAGE_SIZE):
+                    chunk = task_ids[i:i + self.PAGE_SIZE]
+                    try:
+                        self._check(client, chunk)
+                    except Exception as e:
+                        logger.warning("Task list query failed, retrying in %ss: %s", self.poll_interval, e)
+                        for task_id in chunk:
+                            self._record_failure(task_id, e)
+                
+                time.sleep(self.poll_interval)
+    
+    def _check(self, client: httpx.Client, task_ids: list):
+        response = client.get(
+            _TASKS_URL,
+            params={"page_size": len(task_ids), "filter.task_ids": task_ids},
+        )
+        response.raise_for_status()
         
-        if status == "succeeded":
-            print("----- Task succeeded -----")
-            return get_result
-        elif status == "failed":
-            print("----- Task failed -----")
-            raise Exception(f"Video extension failed: {get_result.error}")
-        else:
-            print(f"Current status: {status}, retrying in {poll_interval}s...")
-            time.sleep(poll_interval)
+        seen = set()
+        for item in response.json().get("items", []):
+            seen.add(item["id"])
+            with self._lock:
+                self._failures.pop(item["id"], None)
+            if item.get("status") in TERMINAL_STATUSES:
+                self._finish(item["id"], item)
+        
+        for task_id in task_ids:
+            if task_id not in seen:
+                self._record_failure(task_id, Exception(f"Task {task_id} not found in task list"))
+    
+    def _record_failure(self, task_id: str, error: Exception):
+        with self._lock:
+            # The task may have been discarded since the snapshot was taken
+            if task_id not in self._waiters:
+                return
+            failures = self._failures.get(task_id, 0) + 1
+            self._failures[task_id] = failures
+        if failures >= self.MAX_FAILURES:
+            self._finish(task_id, error)
+    
+    def _finish(self, task_id: str, result):
+        """Hand a task's final result (or error) to all its awaiters and wake them."""
+        with self._lock:
+            self._failures.pop(task_id, None)
+            waiters = self._waiters.pop(task_id, [])
+        for waiter in waiters:
+            waiter.result = result
+            try:
+                waiter.loop.call_soon_threadsafe(waiter.event.set)
+            except RuntimeError:
+                # The awaiting event loop has already been closed
+                pass
+
+
+_watcher = _TaskWatcher()
+
+
+async def wait_task_async(
+    task_id: str,
+    action: str = "generation",
+    timeout: float = None,
+) -> dict:
+    """
+    Wait for a submitted task to finish via the shared watcher.
+    
+    Args:
+        task_id: ID of the task to wait for
+        action: Task kind used in the failure message (default: "generation")
+        timeout: Optional maximum seconds to wait (default: no limit)
+    
+    Returns:
+        dict: Task result JSON once the task has succeeded
+    
+    Raises:
+        TimeoutError: If the task hasn't finished within timeout
+        Exception: If the task does not succeed or can't be queried
+    """
+    waiter = _watcher.register(task_id)
+    try:
+        await asyncio.wait_for(waiter.event.wait(), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        _watcher.discard(task_id, waiter)
+        raise
+    
+    get_result = waiter.result
+    if isinstance(get_result, Exception):
+        raise get_result
+    
+    if get_result.get("status") == "succeeded":
+        logger.info("Task %s succeeded", task_id)
+        return get_result
+    
+    logger.info("Task %s %s", task_id, get_result.get("status"))
+    raise Exception(f"Video {action} failed: {get_result.get('error')}")
+
+
+async def submit_video_async(
+    prompt: str,
+    reference_image_url: str = None,
+    duration: int = 5,
+    camera_fixed: bool = False,
+    model: str = DEFAULT_MODEL,
+    callback_url: str = None,
+) -> str:
+    """
+    Create a video generation task without waiting for it.
+    
+    Takes the same arguments as generate_video_async. Pair with
+    wait_task_async to submit many tasks before blocking on any of them.
+    
+    Returns:
+        str: ID of the created task
+    """
+    content = _build_video_content(prompt, reference_image_url, duration, camera_fixed)
+    
+    async with httpx.AsyncClient(headers=_HEADERS, timeout=30.0) as client:
+        logger.debug("Creating video generation task")
+        task_id = await _create_task_async(client, model, content, callback_url)
+    logger.info("Task created with ID: %s", task_id)
+    
+    return task_id
+
+
+async def generate_video_async(
+    prompt: str,
+    reference_image_url: str = None,
+    duration: int = 5,
+    camera_fixed: bool = False,
+    model: str = DEFAULT_MODEL,
+    callback_url: str = None,
+) -> dict:
+    """
+    Async variant of generate_video, so many tasks can poll concurrently.
+    
+    Takes the same arguments as generate_video (minus the polling options)
+    but talks to the Ark REST API directly. Completion is observed through
+    the shared task watcher, and the task result is returned as a parsed
+    JSON dict.
+    
+    Raises:
+        Exception: If video generation fails
+    """
+    task_id = await submit_video_async(
+        prompt,
+        reference_image_url=reference_image_url,
+        duration=duration,
+        camera_fixed=camera_fixed,
+        model=model,
+        callback_url=callback_url,
+    )
+    return await wait_task_async(task_id, action="generation")
+
 
+async def submit_extend_async(
+    video_url: str,
+    prompt: str,
+    duration: int = 5,
+    model: str = VIDEO_EXTEND_MODEL,
+    callback_url: str = None,
+) -> str:
+    """
+    Create a video extension task without waiting for it.
+    
+    Takes the same arguments as extend_video_async, minus the output
+    options that extend_video doesn't send either. Pair with
+    wait_task_async(task_id, action="extension").
+    
+    Returns:
+        str: ID of the created task
+    """
+    content = _build_extend_content(video_url, prompt, duration)
+    
+    async with httpx.AsyncClient(headers=_HEADERS, timeout=30.0) as client:
+        logger.debug("Creating video extension task")
+        task_id = await _create_task_async(client, model, content, callback_url)
+    logger.info("Task created with ID: %s", task_id)
+    
+    return task_id
+
+
+async def extend_video_async(
+    video_url: str,
+    prompt: str,
+    duration: int = 5,
+    resolution: str = "1080p",
+    aspect_ratio: str = "16:9",
+    generate_audio: bool = True,
+    model: str = VIDEO_EXTEND_MODEL,
+    callback_url: str = None,
+) -> dict:
+    """
+    Async variant of extend_video, so many tasks can poll concurrently.
+    
+    Takes the same arguments as extend_video (minus the polling options)
+    but talks to the Ark REST API directly. Completion is observed through
+    the shared task watcher, and the task result is returned as a parsed
+    JSON dict.
+    
+    Raises:
+        Exception: If video extension fails
+    """
+    task_id = await submit_extend_async(
+        video_url,
+        prompt,
+        duration=duration,
+        model=model,
+        callback_url=callback_url,
+    )
+    return await wait_task_async(task_id, action="extension")
@@ -1,7 +1,12 @@
 import os
+import re
 import argparse
+import functools
+from contextlib import contextmanager
 from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Iterator, Optional, TextIO, Union
 from vertex_provider import generate_text
 
 # Load system prompt from file
@@ -11,7 +16,14 @@ SYSTEM_PROMPT_PATH = SCRIPT_DIR / "story_gen_prompt.txt"
 # Default output directory
 DEFAULT_OUTPUT_DIR = SCRIPT_DIR / "generated_stories"
 
+# Separator between topics when several are generated in one call
+TOPIC_BREAK = "---TOPIC-BREAK---"
 
+# Characters replaced with "_" in filenames (keeps letters incl. CJK, digits, ._-)
+_UNSAFE_FILENAME_RE = re.compile(r'[^\w.\-]')
+
+
+@functools.lru_cache(maxsize=1)
 def load_system_prompt() -> str:
     """Load the system prompt from story_gen_prompt.txt"""
     with open(SYSTEM_PROMPT_PATH, "r", encoding="utf-8") as f:
@@ -22,7 +34,8 @@ def generate_story(
     topic: str,
     count: int = 3,
     system_prompt: str = None,
-) -> str:
+    sink: TextIO = None,
+) -> Optional[str]:
     """
     Generate stories based on a topic.
     
@@ -30,9 +43,10 @@ def generate_story(
         topic: The theme or keywords for story generation (e.g., 面试、相亲、借钱)
         count: Number of stories to generate (default: 3)
         system_prompt: Custom system prompt (uses default if None)
+        sink: Optional file-like object; if given, the response is streamed into it
     
     Returns:
-        str: Generated stories in markdown format
+        str: Generated stories in markdown format, or None if streamed to sink
     """
     if system_prompt is None:
         system_prompt = load_system_prompt()
@@ -50,6 +64,17 @@ def generate_story(
 请根据以上主题，按照 Output Format 生成 {count} 个不同场景的反转短剧剧本。
 """
     
+    # Stream straight into the sink so writing overlaps with generation
+    if sink is not None:
+        for chunk in generate_text(
+            prompt=user_prompt,
+            temperature=1.0,
+            max_output_tokens=8192,
+            stream=True,
+        ):
+            sink.write(chunk)
+        return None
+    
     # Call Vertex AI
     response = generate_text(
         prompt=user_prompt,
@@ -60,25 +85,120 @@ def generate_story(
     return response
 
 
-def save_story(content: str, topic: str, output_dir: Path, index: int = None) -> Path:
+def generate_stories_batch(
+    topics: list[str],
+    count: int = 3,
+    system_prompt: str = None,
+) -> list[str]:
     """
-    Save a story to a text file.
+    Generate stories for several topics in a single Vertex AI call.
+    
+    Args:
+        topics: Themes or keywords, one result per topic
+        count: Number of stories to generate per topic (default: 3)
+        system_prompt: Custom system prompt (uses default if None)
+    
+    Returns:
+        list[str]: Generated stories in markdown format, in the order of topics
+    
+    Raises:
+        ValueError: If the response can't be split into one part per topic
+    """
+    if system_prompt is None:
+        system_prompt = load_system_prompt()
+    
+    topic_lines = "\n".join(f"{i}. {topic}" for i, topic in enumerate(topics, 1))
+    
+    # Build the full prompt
+    user_prompt = f"""
+{system_prompt}
+
+---
+
+## 用户请求
+主题/关键词 (共 {len(topics)} 个):
+{topic_lines}
+每个主题生成数量: {count} 个剧本
+
+请按顺序为以上每个主题，按照 Output Format 各生成 {count} 个不同场景的反转短剧剧本。
+不同主题之间单独一行输出分隔符 {TOPIC_BREAK}，不要在其他地方输出该分隔符。
+"""
+    
+    # Call Vertex AI, scaling the output budget with the number of topics
+    response = generate_text(
+        prompt=user_prompt,
+        temperature=1.0,
+        max_output_tokens=min(8192 * len(topics), 65536),
+    )
+    
+    parts = [part.strip() for part in response.split(TOPIC_BREAK) if part.strip()]
+    if len(parts) != len(topics):
+        raise ValueError(f"Expected {len(topics)} topic sections, got {len(parts)}")
+    
+    return parts
+
+
+def _generate_topic_group(
+    group: list[tuple[int, str]],
+    count: int,
+    system_prompt: str,
+    output_dir: Path,
+) -> Optional[list[tuple[int, str, Path]]]:
+    """
+    Generate several (index, topic) pairs in one call and save each topic.
+    
+    Returns:
+        list: (index, topic, saved path) per topic, or None if the response
+        couldn't be split and the topics need to be generated one by one
+    """
+    topics = [topic for _, topic in group]
+    try:
+        contents = generate_stories_batch(topics, count=count, system_prompt=system_prompt)
+    except ValueError as e:
+        print(f"⚠️ 合并生成无法拆分 ({e})，改为逐个生成: {', '.join(topics)}")
+        return None
+    
+    return [
+        (i, topic, save_story(content, topic, output_dir, index=i))
+        for (i, topic), content in zip(group, contents)
+    ]
+
+
+def _generate_topic(
+    index: int,
+    topic: str,
+    count: int,
+    system_prompt: str,
+    output_dir: Path,
+) -> list[tuple[int, str, Path]]:
+    """Generate a single topic, streaming the response into its file."""
+    with open_story(topic, output_dir, index=index) as (f, filepath):
+        generate_story(topic=topic, count=count, system_prompt=system_prompt, sink=f)
+    return [(index, topic, filepath)]
+
+
+@contextmanager
+def open_story(topic: str, output_dir: Path, index: int = None) -> Iterator[tuple[TextIO, Path]]:
+    """
+    Open a new story file for writing.
+    
+    Content goes to a temp file that is moved into place only when the block
+    exits cleanly, so an interrupted run never leaves a partial story.
     
     Args:
-        content: Story content
         topic: Topic used for filename
         output_dir: Directory to save the file
         index: Optional index for batch generation
     
-    Returns:
-        Path: Path to the saved file
+    Yields:
+        tuple: (writable text file, final path of the story)
     """
     # Create output directory if it doesn't exist
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Generate filename with timestamp
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    safe_topic = "".join(c if c.isalnum() or c in "._-" else "_" for c in topic)[:30]
+    safe_topic = _UNSAFE_FILENAME_RE.sub("_", topic[:30])
     
     if index is not None:
         filename = f"story_{safe_topic}_{timestamp}_{index}.md"
@@ -86,8 +206,31 @@ def save_story(content: str, topic: str, output_dir: Path, index: int = None) ->
         filename = f"story_{safe_topic}_{timestamp}.md"
     
     filepath = output_dir / filename
+    tmp_path = filepath.with_suffix(filepath.suffix + ".tmp")
+    
+    try:
+        with open(tmp_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+            yield f, filepath
+        os.replace(tmp_path, filepath)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+def save_story(content: str, topic: str, output_dir: Path, index: int = None) -> Path:
+    """
+    Save a story to a text file.
     
-    with open(filepath, "w", encoding="utf-8") as f:
+    Args:
+        content: Story content
+        topic: Topic used for filename
+        output_dir: Directory to save the file
+        index: Optional index for batch generation
+    
+    Returns:
+        Path: Path to the saved file
+    """
+    with open_story(topic, output_dir, index=index) as (f, filepath):
         f.write(content)
     
     return filepath
@@ -97,6 +240,7 @@ def batch_generate(
     topics: list[str],
     stories_per_topic: int = 3,
     output_dir: Path = None,
+    batch_size: int = 1,
 ) -> list[Path]:
     """
     Batch generate stories for multiple topics.
@@ -105,9 +249,10 @@ def batch_generate(
         topics: List of topics/keywords
         stories_per_topic: Number of stories per topic (default: 3)
         output_dir: Output directory (uses default if None)
+        batch_size: Number of topics combined into one Vertex AI call (default: 1, no batching)
     
     Returns:
-        list[Path]: List of paths to saved files
+        list[Path]: List of paths to saved files, in completion order
     """
     if output_dir is None:
         output_dir = DEFAULT_OUTPUT_DIR
@@ -115,23 +260,68 @@ def batch_generate(
     saved_files = []
     system_prompt = load_system_prompt()
     
-    for i, topic in enumerate(topics, 1):
-        print(f"\n[{i}/{len(topics)}] 生成主题: {topic}")
-        print("-" * 40)
+    if not topics:
+        return saved_files
+    
+    # Group topics so each call amortizes request overhead over several topics
+    numbered = list(enumerate(topics, 1))
+    batch_size = max(1, batch_size)
+    groups = [numbered[k:k + batch_size] for k in range(0, len(numbered), batch_size)]
+    
+    # Generation is network-bound, so groups are requested concurrently. The
+    # pool is sized by topic so an unsplittable group can fan out again.
+    with ThreadPoolExecutor(max_workers=min(8, len(topics))) as executor:
+        futures = {}
         
-        try:
-            content = generate_story(
+        def submit_topic(i: int, topic: str):
+            future = executor.submit(
+                _generate_topic,
+                index=i,
                 topic=topic,
                 count=stories_per_topic,
                 system_prompt=system_prompt,
+                output_dir=output_dir,
             )
-            
-            filepath = save_story(content, topic, output_dir, index=i)
-            saved_files.append(filepath)
-            print(f"✅ 已保存: {filepath}")
-            
-        except Exception as e:
-            print(f"❌ 生成失败: {e}")
+            futures[future] = [(i, topic)]
+            return future
+        
+        for group in groups:
+            for i, topic in group:
+                print(f"[{i}/{len(topics)}] 生成主题: {topic}")
+            if len(group) == 1:
+                submit_topic(*group[0])
+                continue
+            future = executor.submit(
+                _generate_topic_group,
+                group=group,
+                count=stories_per_topic,
+                system_prompt=system_prompt,
+                output_dir=output_dir,
+            )
+            futures[future] = group
+        
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = futures.pop(future)
+                try:
+                    outcomes = future.result()
+                except Exception as e:
+                    outcomes = [(i, topic, e) for i, topic in group]
+                
+                # An unsplittable group goes back to the pool one topic at a time
+                if outcomes is None:
+                    for i, topic in group:
+                        pending.add(submit_topic(i, topic))
+                    continue
+                
+                for i, topic, outcome in outcomes:
+                    if isinstance(outcome, Exception):
+                        print(f"❌ [{i}/{len(topics)}] {topic} 生成失败: {outcome}")
+                    else:
+                        saved_files.append(outcome)
+                        print(f"✅ [{i}/{len(topics)}] 已保存: {outcome}")
     
     return saved_files
 
@@ -150,6 +340,9 @@ def main():
   
   # 指定输出目录
   python story_gen.py "相亲" -o ./my_stories
+  
+  # 每 4 个主题合并为一次请求
+  python story_gen.py "面试" "借钱" "买车" "相亲" -b 4
         """
     )
     
@@ -170,6 +363,12 @@ def main():
         default=None,
         help="输出目录 (默认: ./generated_stories)"
     )
+    parser.add_argument(
+        "-b", "--batch-size",
+        type=int,
+        default=1,
+        help="每次请求合并生成的主题数量 (默认: 1，不合并)"
+    )
     
     args = parser.parse_args()
     
@@ -186,6 +385,7 @@ def main():
         topics=args.topics,
         stories_per_topic=args.count,
         output_dir=output_dir,
+        batch_size=args.batch_size,
     )
     
     print("\n" + "=" * 50)
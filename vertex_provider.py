@@ -1,4 +1,20 @@
+"""
+Vertex AI (Gemini) text and vision helpers.
+
+Setup:
+    pip install google-genai python-dotenv pillow httpx
+    pip install h2  # optional, enables HTTP/2 for image downloads
+
+Set VERTEX_PROJECT_ID in the environment or a .env file.
+"""
+import io
 import os
+import functools
+import importlib.util
+import threading
+import httpx
+from typing import Iterator, Union
+from PIL import Image
 from dotenv import load_dotenv
 from google import genai
 from google.genai.types import GenerateContentConfig
@@ -13,11 +29,43 @@ _location = os.getenv("VERTEX_LOCATION", "global")
 # Override to global for Gemini 3 models (required)
 _location = "global"
 
-_client = genai.Client(
-    vertexai=True,
-    project=_project_id,
-    location=_location,
-)
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _get_client() -> genai.Client:
+    """Return the Vertex AI client, creating it once on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = genai.Client(
+                vertexai=True,
+                project=_project_id,
+                location=_location,
+            )
+        return _client
+
+
+# Shared HTTP client for image downloads, created on first image fetch
+_http = None
+_http_lock = threading.Lock()
+
+
+def _get_http() -> httpx.Client:
+    """Return the shared keep-alive HTTP client, using HTTP/2 when h2 is installed."""
+    global _http
+    with _http_lock:
+        if _http is None:
+            _http = httpx.Client(
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=httpx.Timeout(10.0),
+                limits=httpx.Limits(max_keepalive_connections=16),
+                follow_redirects=True,
+                headers={"User-Agent": "nanostory/1.0"},
+            )
+        return _http
+
 
 # Gemini 3 Pro model
 DEFAULT_MODEL = "gemini-3-pro-preview"
@@ -32,7 +80,8 @@ def generate_text(
     max_output_tokens: int = 8192,
     temperature: float = 1.0,
     system_instruction: str = None,
-) -> str:
+    stream: bool = False,
+) -> Union[str, Iterator[str]]:
     """
     Generate text using Vertex AI Gemini model.
     
@@ -45,34 +94,22 @@ def generate_text(
         max_output_tokens: Maximum tokens in response (default: 8192)
         temperature: Sampling temperature (default: 1.0)
         system_instruction: Optional system instruction
+        stream: If True, return an iterator of text chunks as they arrive (default: False)
     
     Returns:
-        str: Generated text response
+        str: Generated text response, or an iterator of text chunks if stream is True
     
     Note: Only one of image_path, image_url, or image_bytes should be provided.
     """
-    from PIL import Image
-    import io
-    
-    # Build content parts
-    content_parts = []
-    
-    # Add image if provided
+    # Build contents: image + prompt if an image is given, else the prompt alone
     if image_path:
-        pil_image = Image.open(image_path)
-        content_parts.append(pil_image)
+        contents = [Image.open(image_path), prompt]
     elif image_url:
-        import urllib.request
-        with urllib.request.urlopen(image_url) as response:
-            img_bytes = response.read()
-        pil_image = Image.open(io.BytesIO(img_bytes))
-        content_parts.append(pil_image)
+        contents = [Image.open(io.BytesIO(_fetch_image_bytes(image_url))), prompt]
     elif image_bytes:
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        content_parts.append(pil_image)
-    
-    # Add text prompt
-    content_parts.append(prompt)
+        contents = [Image.open(io.BytesIO(image_bytes)), prompt]
+    else:
+        contents = prompt
     
     # Build config
     config = {
@@ -82,10 +119,13 @@ def generate_text(
     if system_instruction:
         config["system_instruction"] = system_instruction
     
+    if stream:
+        return _stream_text(model, contents, config)
+    
     # Generate response
-    response = _client.models.generate_content(
+    response = _get_client().models.generate_content(
         model=model,
-        contents=content_parts if len(content_parts) > 1 else prompt,
+        contents=contents,
         config=config,
     )
     
@@ -95,6 +135,30 @@ def generate_text(
     return response.text
 
 
+def _stream_text(model: str, contents, config: dict) -> Iterator[str]:
+    """Yield response text chunks from generate_content_stream as they arrive."""
+    received = False
+    for chunk in _get_client().models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config=config,
+    ):
+        if chunk.text:
+            received = True
+            yield chunk.text
+    
+    if not received:
+        raise Exception("Empty response from Vertex AI")
+
+
+@functools.lru_cache(maxsize=64)
+def _fetch_image_bytes(url: str) -> bytes:
+    """Download an image URL, caching the encoded bytes per URL."""
+    response = _get_http().get(url)
+    response.raise_for_status()
+    return response.content
+
+
 def _get_mime_type(url: str) -> str:
     """Infer MIME type from URL extension."""
     url_lower = url.lower()
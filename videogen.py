@@ -1,14 +1,39 @@
+import os
 import re
+import json
+import logging
+import asyncio
+import time
+import hashlib
 import argparse
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
-from seedance_provider import generate_video, extend_video
+from seedance_provider import submit_video_async, wait_task_async
 
+# Precompiled patterns for script parsing
+_TITLE_RE = re.compile(r'### 剧本标题[：:]\s*(.+)')
+_CHAR_RE = re.compile(r'\*\s*\*\*(角色[AB].*?)\*\*[：:]\s*(.+)')
+# Match table rows: | time | visual | dialogue | audio |
+_TABLE_RE = re.compile(r'\|\s*\*\*(\d+-\d+s|结尾)\*\*\s*\|\s*(.+?)\s*\|\s*(.+?)\s*\|\s*(.+?)\s*\|')
+_BR_RE = re.compile(r'<br\s*/?>')
+# [特写]/[中景] shot tags and **bold** spans, removed in a single pass
+_CLEAN_RE = re.compile(r'\[.*?\]|\*\*.*?\*\*')
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# Set NANOSTORY_VERBOSE=1 to log full task results and polling status
+VERBOSE = os.getenv("NANOSTORY_VERBOSE", "0") == "1"
+
+# Results of earlier generations keyed by prompt hash, kept in the output directory
+PROMPT_CACHE_NAME = "prompt_cache.json"
+# Ark video URLs expire after 24 hours; drop cached results well before that
+PROMPT_CACHE_TTL = 20 * 3600
+
+
+@dataclass(slots=True, frozen=True)
 class Scene:
     """Represents a single scene/shot in a script."""
     time_range: str  # e.g., "0-5s", "5-10s"
@@ -18,88 +43,86 @@ class Scene:
     duration: int = 5  # Estimated duration in seconds
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Script:
     """Represents a complete script with multiple scenes."""
     title: str
-    characters: dict  # {role_name: description}
-    scenes: List[Scene]
+    characters: Tuple[Tuple[str, str], ...]  # ((role_name, description), ...)
+    scenes: Tuple[Scene, ...]
     
 
-def parse_script_md(md_path: str) -> List[Script]:
+def parse_script_md(md_path: str) -> Iterator[Script]:
     """
-    Parse a script markdown file and extract all scripts.
+    Parse a script markdown file line by line, yielding scripts as they complete.
     
     Args:
         md_path: Path to the markdown file
         
-    Returns:
-        List of Script objects
+    Yields:
+        Script objects, in file order (scripts without scenes are skipped)
     """
-    with open(md_path, "r", encoding="utf-8") as f:
-        content = f.read()
-    
-    scripts = []
+    title = None
+    characters = {}
+    scenes = []
     
-    # Split by script sections (### 剧本标题)
-    script_sections = re.split(r'(?=### 剧本标题)', content)
-    
-    for section in script_sections:
-        if not section.strip() or '### 剧本标题' not in section:
-            continue
-            
-        # Extract title
-        title_match = re.search(r'### 剧本标题[：:]\s*(.+)', section)
-        title = title_match.group(1).strip() if title_match else "Unknown"
-        
-        # Extract characters
-        characters = {}
-        char_matches = re.findall(r'\*\s*\*\*(角色[AB].*?)\*\*[：:]\s*(.+)', section)
-        for role, desc in char_matches:
-            characters[role.strip()] = desc.strip()
-        
-        # Extract table rows (scenes)
-        scenes = []
-        # Match table rows: | time | visual | dialogue | audio |
-        table_pattern = r'\|\s*\*\*(\d+-\d+s|结尾)\*\*\s*\|\s*(.+?)\s*\|\s*(.+?)\s*\|\s*(.+?)\s*\|'
-        
-        for match in re.finditer(table_pattern, section):
-            time_range = match.group(1)
-            visual = match.group(2).strip()
-            dialogue = match.group(3).strip()
-            audio = match.group(4).strip()
+    with open(md_path, "r", encoding="utf-8") as f:
+        for line in f:
+            # A new script section (### 剧本标题) flushes the current one
+            if line.startswith('### 剧本标题'):
+                if scenes:
+                    yield _make_script(title, characters, scenes)
+                
+                title_match = _TITLE_RE.search(line)
+                title = title_match.group(1).strip() if title_match else "Unknown"
+                characters = {}
+                scenes = []
+                continue
             
-            # Clean up HTML tags
-            visual = re.sub(r'<br\s*/?>', ' ', visual)
-            dialogue = re.sub(r'<br\s*/?>', ' ', dialogue)
-            audio = re.sub(r'<br\s*/?>', ' ', audio)
+            if title is None:
+                continue
             
-            # Parse duration from time range
-            if time_range == "结尾":
-                duration = 3  # Short ending shot
-            else:
-                try:
-                    start, end = time_range.replace('s', '').split('-')
-                    duration = int(end) - int(start)
-                except:
-                    duration = 5
+            # Extract characters
+            for role, desc in _CHAR_RE.findall(line):
+                characters[role.strip()] = desc.strip()
             
-            scenes.append(Scene(
-                time_range=time_range,
-                visual_description=visual,
-                dialogue=dialogue,
-                audio=audio,
-                duration=duration,
-            ))
-        
-        if scenes:
-            scripts.append(Script(
-                title=title,
-                characters=characters,
-                scenes=scenes,
-            ))
+            # Extract table rows (scenes), cleaning up HTML line breaks first
+            if '|' in line:
+                for match in _TABLE_RE.finditer(_BR_RE.sub(' ', line)):
+                    scenes.append(_parse_scene_row(match))
     
-    return scripts
+    if scenes:
+        yield _make_script(title, characters, scenes)
+
+
+def _make_script(title: str, characters: dict, scenes: List[Scene]) -> Script:
+    """Freeze parsed fields into an immutable Script."""
+    return Script(title=title, characters=tuple(characters.items()), scenes=tuple(scenes))
+
+
+def _parse_scene_row(match: re.Match) -> Scene:
+    """Build a Scene from a matched table row."""
+    time_range = match.group(1)
+    visual = match.group(2).strip()
+    dialogue = match.group(3).strip()
+    audio = match.group(4).strip()
+    
+    # Parse duration from time range
+    if time_range == "结尾":
+        duration = 3  # Short ending shot
+    else:
+        try:
+            start, end = time_range.replace('s', '').split('-')
+            duration = int(end) - int(start)
+        except:
+            duration = 5
+    
+    return Scene(
+        time_range=time_range,
+        visual_description=visual,
+        dialogue=dialogue,
+        audio=audio,
+        duration=duration,
+    )
 
 
 def build_video_prompt(scene: Scene, script: Script, style: str = "cinematic") -> str:
@@ -118,8 +141,7 @@ def build_video_prompt(scene: Scene, script: Script, style: str = "cinematic") -
     visual = scene.visual_description
     
     # Remove markdown formatting
-    visual = re.sub(r'\[.*?\]', '', visual)  # Remove [特写], [中景], etc. but keep the content
-    visual = re.sub(r'\*\*.*?\*\*', '', visual)  # Remove bold
+    visual = _CLEAN_RE.sub('', visual)  # Remove [特写], [中景], etc. and bold
     
     # Build prompt with style hints
     prompt = f"{visual}. {style} style, high quality, detailed"
@@ -133,6 +155,7 @@ def generate_videos_from_script(
     script_index: int = None,
     duration: int = 5,
     dry_run: bool = False,
+    force: bool = False,
 ) -> List[dict]:
     """
     Generate videos for all scenes in a script markdown file.
@@ -143,6 +166,8 @@ def generate_videos_from_script(
         script_index: Generate only this script (0-indexed), or None for all
         duration: Video duration per scene (default: 5)
         dry_run: If True, only print prompts without generating
+        force: If True, regenerate scenes even if their prompt is cached
+            (cached results are kept in output_dir and expire after PROMPT_CACHE_TTL)
         
     Returns:
         List of generation results
@@ -156,64 +181,178 @@ def generate_videos_from_script(
     
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Parse scripts
-    scripts = parse_script_md(str(md_path))
-    print(f"📖 Found {len(scripts)} scripts in {md_path.name}")
+    print(f"📖 Reading scripts from {md_path.name}")
+    
+    cache_path = output_dir / PROMPT_CACHE_NAME
+    return asyncio.run(_generate_videos_async(
+        md_path, script_index, duration, dry_run, cache_path, force=force,
+    ))
+
+
+def _prompt_key(prompt: str, duration: int) -> str:
+    """Hash a cleaned-up prompt and its duration into a cache key."""
+    return hashlib.blake2b(f"{duration}:{prompt}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _load_prompt_cache(cache_path: Path) -> dict:
+    """
+    Load cached results from disk, dropping entries whose URLs may have expired.
     
-    if script_index is not None:
-        if script_index >= len(scripts):
-            raise ValueError(f"Script index {script_index} out of range (0-{len(scripts)-1})")
-        scripts = [scripts[script_index]]
+    Returns:
+        dict: {key: task result JSON}
+    """
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
     
-    results = []
+    cutoff = time.time() - PROMPT_CACHE_TTL
+    return {
+        key: entry["result"]
+        for key, entry in entries.items()
+        if isinstance(entry, dict) and entry.get("created_at", 0) >= cutoff and "result" in entry
+    }
+
+
+def _save_prompt_cache(cache_path: Path, results: dict):
+    """Add freshly generated results to the on-disk cache, written atomically."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        entries = {}
+    
+    # Prune expired entries while rewriting the file
+    cutoff = time.time() - PROMPT_CACHE_TTL
+    entries = {
+        key: entry
+        for key, entry in entries.items()
+        if isinstance(entry, dict) and entry.get("created_at", 0) >= cutoff
+    }
+    now = time.time()
+    entries.update({key: {"created_at": now, "result": result} for key, result in results.items()})
+    
+    tmp_path = cache_path.with_suffix(".json.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    os.replace(tmp_path, cache_path)
+
+
+async def _generate_videos_async(
+    md_path: Path,
+    script_index: Optional[int],
+    duration: int,
+    dry_run: bool,
+    cache_path: Path,
+    force: bool = False,
+) -> List[dict]:
+    """
+    Stream scripts from md_path and generate videos for their scenes.
+    
+    Each script's uncached scenes are submitted as soon as the script is
+    parsed, and waiting happens in the background, so tasks from all
+    scripts overlap while only per-scene records are kept. Identical
+    prompts are generated once per run, and prompts already in the cache
+    reuse the earlier result unless force is set.
+    """
+    cache = _load_prompt_cache(cache_path)
+    waits = {}  # {key: asyncio.Task} for tasks submitted this run
+    scenes = []  # (script_title, scene_index, time_range, prompt, key)
+    script_count = 0
     
-    for i, script in enumerate(scripts):
+    # Scripts are parsed lazily, one at a time
+    for i, script in enumerate(parse_script_md(str(md_path))):
+        script_count += 1
+        if script_index is not None and i != script_index:
+            continue
+        
         print(f"\n{'='*60}")
         print(f"🎬 Script {i+1}: {script.title}")
         print(f"{'='*60}")
-        print(f"Characters: {script.characters}")
+        logger.debug("Characters: %s", script.characters)
         print(f"Scenes: {len(script.scenes)}")
         
+        new = {}  # {key: prompt} first seen in this script
         for j, scene in enumerate(script.scenes):
             print(f"\n--- Scene {j+1}: {scene.time_range} ---")
             
             prompt = build_video_prompt(scene, script)
             print(f"Prompt: {prompt[:100]}...")
             
-            if dry_run:
-                print("(dry run - skipping generation)")
-                continue
-            
-            try:
-                result = generate_video(
-                    prompt=prompt,
-                    duration=duration,
-                    camera_fixed=False,
-                )
-                
-                # Save result info
-                result_info = {
-                    "script_title": script.title,
-                    "scene_index": j,
-                    "time_range": scene.time_range,
-                    "prompt": prompt,
-                    "result": result,
-                }
-                results.append(result_info)
-                
-                print(f"✅ Generated: {result}")
-                
-            except Exception as e:
-                print(f"❌ Failed: {e}")
-                results.append({
-                    "script_title": script.title,
-                    "scene_index": j,
-                    "error": str(e),
-                })
+            key = _prompt_key(prompt, duration)
+            scenes.append((script.title, j, scene.time_range, prompt, key))
+            if (force or key not in cache) and key not in waits:
+                new.setdefault(key, prompt)
+        
+        if dry_run:
+            print("(dry run - skipping generation)")
+            continue
+        
+        # Submit this script's scenes now and wait for them in the background
+        task_ids = await asyncio.gather(
+            *[
+                submit_video_async(prompt=prompt, duration=duration, camera_fixed=False)
+                for prompt in new.values()
+            ],
+            return_exceptions=True,
+        )
+        for key, task_id in zip(new, task_ids):
+            waits[key] = asyncio.create_task(_wait_submitted(task_id))
+    
+    print(f"📖 Found {script_count} scripts in {md_path.name}")
+    
+    if script_index is not None and script_index >= script_count:
+        raise ValueError(f"Script index {script_index} out of range (0-{script_count-1})")
+    
+    if dry_run:
+        return []
+    
+    outcomes = await asyncio.gather(*waits.values(), return_exceptions=True)
+    fresh = dict(zip(waits, outcomes))
+    
+    succeeded = {key: outcome for key, outcome in fresh.items() if not isinstance(outcome, Exception)}
+    if succeeded:
+        cache.update(succeeded)
+        _save_prompt_cache(cache_path, succeeded)
+    
+    results = []
+    for title, j, time_range, prompt, key in scenes:
+        outcome = fresh[key] if key in fresh else cache[key]
+        
+        if isinstance(outcome, Exception):
+            print(f"❌ {title} scene {j+1} failed: {outcome}")
+            results.append({
+                "script_title": title,
+                "scene_index": j,
+                "error": str(outcome),
+            })
+            continue
+        
+        # Save result info
+        results.append({
+            "script_title": title,
+            "scene_index": j,
+            "time_range": time_range,
+            "prompt": prompt,
+            "result": outcome,
+        })
+        if key in fresh:
+            print(f"✅ {title} scene {j+1} generated: task={outcome.get('id')}")
+        else:
+            print(f"♻️ {title} scene {j+1} reused cached result: task={outcome.get('id')}")
+        logger.debug("%s scene %d result: %s", title, j + 1, outcome)
     
     return results
 
 
+async def _wait_submitted(task_id) -> dict:
+    """Wait for a submitted task, re-raising if its submission failed."""
+    if isinstance(task_id, Exception):
+        raise task_id
+    return await wait_task_async(task_id)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="从剧本 Markdown 文件批量生成视频",
@@ -261,9 +400,19 @@ def main():
         action="store_true",
         help="仅预览 prompts，不实际生成视频"
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="忽略缓存，重新生成相同 prompt 的场景"
+    )
     
     args = parser.parse_args()
     
+    logging.basicConfig(
+        level=logging.DEBUG if VERBOSE else logging.WARNING,
+        format="%(message)s",
+    )
+    
     print("=" * 60)
     print("🎥 剧本视频生成器")
     print("=" * 60)
@@ -277,6 +426,7 @@ def main():
         script_index=args.script,
         duration=args.duration,
         dry_run=args.dry_run,
+        force=args.force,
     )
     
     print("\n" + "=" * 60)